@@ -1,11 +1,14 @@
+import asyncio
 from collections import (
-    namedtuple,
+    deque,
 )
 import datetime
+import functools
 import hashlib
 import hmac
 import json
 import os
+import time
 import urllib
 
 from jupyterhub.spawner import (
@@ -14,16 +17,15 @@ from jupyterhub.spawner import (
 from tornado import (
     gen,
 )
-from tornado.concurrent import (
-    Future,
+from tornado.ioloop import (
+    IOLoop,
 )
 from tornado.httpclient import (
-    AsyncHTTPClient,
     HTTPError,
     HTTPRequest,
 )
 from traitlets.config.configurable import (
-    Configurable,
+    LoggingConfigurable,
 )
 from traitlets import (
     Bool,
@@ -38,9 +40,54 @@ from traitlets import (
     default,
 )
 
-AwsCreds = namedtuple('AwsCreds', [
-    'access_key_id', 'secret_access_key', 'pre_auth_headers',
-])
+# A single HTTP client is shared by all spawners and authentication classes, rather than
+# using the default per-IOLoop AsyncHTTPClient: this allows more than the default of 10
+# concurrent requests when many users are starting or stopping at once. If pycurl is
+# available, the curl client is used since it keeps connections to AWS alive between requests
+HTTP_MAX_CLIENTS = 100
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_REQUEST_TIMEOUT = 30
+_http_client = None
+
+
+def _get_http_client():
+    global _http_client
+
+    if _http_client is None:
+        try:
+            from tornado.curl_httpclient import CurlAsyncHTTPClient as client_class
+        except ImportError:
+            from tornado.simple_httpclient import SimpleAsyncHTTPClient as client_class
+        _http_client = client_class(force_instance=True, max_clients=HTTP_MAX_CLIENTS)
+
+    return _http_client
+
+
+# Signed on every request, in addition to any headers that come with the credentials
+REQUEST_SIGNED_HEADER_KEYS = ['content-type', 'host', 'x-amz-content-sha256', 'x-amz-date', 'x-amz-target']
+
+
+class AwsCreds:
+    # The headers derived from the credentials only change when the credentials do, so they
+    # are computed once here, rather than on every signed request. The signing keys derived
+    # from the secret are also cached here, by _signing_key
+
+    __slots__ = (
+        'access_key_id', 'secret_access_key', 'pre_auth_headers',
+        'pre_auth_headers_lower', 'signed_header_keys', 'signed_headers', 'signing_keys',
+    )
+
+    def __init__(self, access_key_id, secret_access_key, pre_auth_headers):
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.pre_auth_headers = pre_auth_headers
+        self.pre_auth_headers_lower = {
+            header_key.lower().strip(): header_value.strip()
+            for header_key, header_value in pre_auth_headers.items()
+        }
+        self.signed_header_keys = sorted(list(self.pre_auth_headers_lower.keys()) + REQUEST_SIGNED_HEADER_KEYS)
+        self.signed_headers = ';'.join(self.signed_header_keys)
+        self.signing_keys = {}
 
 
 class Datetime(TraitType):
@@ -48,7 +95,7 @@ class Datetime(TraitType):
     default_value = datetime.datetime(1900, 1, 1)
 
 
-class FargateSpawnerAuthentication(Configurable):
+class FargateSpawnerAuthentication(LoggingConfigurable):
 
     async def get_credentials(self):
         raise NotImplementedError()
@@ -59,70 +106,118 @@ class FargateSpawnerSecretAccessKeyAuthentication(FargateSpawnerAuthentication):
     aws_access_key_id = Unicode(config=True)
     aws_secret_access_key = Unicode(config=True)
     pre_auth_headers = Dict()
+    credentials = Instance(AwsCreds, allow_none=True)
 
     async def get_credentials(self):
-        return AwsCreds(
-            access_key_id=self.aws_access_key_id,
-            secret_access_key=self.aws_secret_access_key,
-            pre_auth_headers=self.pre_auth_headers,
-        )
-
-
-class FargateSpawnerECSRoleAuthentication(FargateSpawnerAuthentication):
+        if self.credentials is None:
+            self.credentials = AwsCreds(
+                access_key_id=self.aws_access_key_id,
+                secret_access_key=self.aws_secret_access_key,
+                pre_auth_headers=self.pre_auth_headers,
+            )
+
+        return self.credentials
+
+
+class FargateSpawnerRefreshableAuthentication(FargateSpawnerAuthentication):
+    # Temporary credentials are refreshed before they expire, rather than at expiry, so a
+    # request signed just before the expiration time doesn't arrive at AWS with expired
+    # credentials. Within the advisory period, the refresh happens in the background and the
+    # current credentials are used. Within the mandatory period, callers wait for the refresh.
+    # Only one refresh is in flight at a time, and since all spawners share one instance of the
+    # authentication class, many concurrent spawners don't all hit the metadata endpoint at once.
+    # The endpoint can return credentials that are already within the mandatory period, e.g. EC2
+    # only rotates them 5 minutes before they expire. These are used until they actually expire,
+    # with refreshes no more often than the minimum interval, rather than on every call
 
     aws_access_key_id = Unicode()
     aws_secret_access_key = Unicode()
     pre_auth_headers = Dict()
+    credentials = Instance(AwsCreds, allow_none=True)
     expiration = Datetime()
+    refreshed_at = Datetime()
+
+    advisory_refresh_timeout = datetime.timedelta(minutes=15)
+    mandatory_refresh_timeout = datetime.timedelta(minutes=10)
+    minimum_refresh_interval = datetime.timedelta(minutes=1)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._refresh_lock = asyncio.Lock()
 
     async def get_credentials(self):
-        now = datetime.datetime.now()
+        if self._needs_refresh(self.mandatory_refresh_timeout):
+            await self._refresh(self.mandatory_refresh_timeout)
+        elif self._needs_refresh(self.advisory_refresh_timeout) and not self._refresh_lock.locked():
+            asyncio.ensure_future(self._refresh_in_background())
+
+        return self.credentials
 
-        if now > self.expiration:
-            request = HTTPRequest('http://169.254.170.2' + os.environ['AWS_CONTAINER_CREDENTIALS_RELATIVE_URI'], method='GET')
-            creds = json.loads((await AsyncHTTPClient().fetch(request)).body.decode('utf-8'))
+    def _needs_refresh(self, refresh_timeout):
+        now = datetime.datetime.utcnow()
+        return \
+            now >= self.expiration or \
+            now > self.expiration - refresh_timeout and now >= self.refreshed_at + self.minimum_refresh_interval
+
+    async def _refresh_in_background(self):
+        try:
+            await self._refresh(self.advisory_refresh_timeout)
+        except Exception:
+            self.log.exception('Unable to refresh credentials')
+
+    async def _refresh(self, refresh_timeout):
+        async with self._refresh_lock:
+            # The credentials may have been refreshed while waiting for the lock
+            if not self._needs_refresh(refresh_timeout):
+                return
+
+            creds = await self._fetch_credentials()
             self.aws_access_key_id = creds['AccessKeyId']
             self.aws_secret_access_key = creds['SecretAccessKey']
             self.pre_auth_headers = {
                 'x-amz-security-token': creds['Token'],
             }
-            self.expiration = datetime.datetime.strptime(creds['Expiration'], '%Y-%m-%dT%H:%M:%SZ')
+            self.credentials = AwsCreds(
+                access_key_id=self.aws_access_key_id,
+                secret_access_key=self.aws_secret_access_key,
+                pre_auth_headers=self.pre_auth_headers,
+            )
+            self.expiration = _parse_expiration(creds['Expiration'])
+            self.refreshed_at = datetime.datetime.utcnow()
+
+            if self.refreshed_at > self.expiration - self.mandatory_refresh_timeout:
+                self.log.warning('Refreshed credentials expire at %s, within the mandatory refresh period',
+                                 self.expiration)
+
+    async def _fetch_credentials(self):
+        raise NotImplementedError()
 
-        return AwsCreds(
-            access_key_id=self.aws_access_key_id,
-            secret_access_key=self.aws_secret_access_key,
-            pre_auth_headers=self.pre_auth_headers,
-        )
 
+def _parse_expiration(expiration):
+    # The expiration is always of the form %Y-%m-%dT%H:%M:%SZ, so it's parsed directly,
+    # rather than with the much slower, general purpose, strptime
+    return datetime.datetime(
+        int(expiration[0:4]), int(expiration[5:7]), int(expiration[8:10]),
+        int(expiration[11:13]), int(expiration[14:16]), int(expiration[17:19]),
+    )
 
-class FargateSpawnerEC2InstanceProfileAuthentication(FargateSpawnerAuthentication):
 
-    aws_access_key_id = Unicode()
-    aws_secret_access_key = Unicode()
-    pre_auth_headers = Dict()
-    expiration = Datetime()
-    aws_iam_role = Unicode()
+class FargateSpawnerECSRoleAuthentication(FargateSpawnerRefreshableAuthentication):
 
-    async def get_credentials(self):
-        now = datetime.datetime.now()
+    async def _fetch_credentials(self):
+        request = HTTPRequest('http://169.254.170.2' + os.environ['AWS_CONTAINER_CREDENTIALS_RELATIVE_URI'], method='GET')
+        return json.loads((await _get_http_client().fetch(request)).body)
 
-        if now > self.expiration:
-            request = HTTPRequest('http://169.254.169.254/latest/meta-data/iam/security-credentials/', method='GET')
-            aws_iam_role = (await AsyncHTTPClient().fetch(request)).body.decode('utf-8')
-            request = HTTPRequest('http://169.254.169.254/latest/meta-data/iam/security-credentials/' + aws_iam_role, method='GET')
-            creds = json.loads((await AsyncHTTPClient().fetch(request)).body.decode('utf-8'))
-            self.aws_access_key_id = creds['AccessKeyId']
-            self.aws_secret_access_key = creds['SecretAccessKey']
-            self.pre_auth_headers = {
-                'x-amz-security-token': creds['Token'],
-            }
-            self.expiration = datetime.datetime.strptime(creds['Expiration'], '%Y-%m-%dT%H:%M:%SZ')
 
-        return AwsCreds(
-            access_key_id=self.aws_access_key_id,
-            secret_access_key=self.aws_secret_access_key,
-            pre_auth_headers=self.pre_auth_headers,
-        )
+class FargateSpawnerEC2InstanceProfileAuthentication(FargateSpawnerRefreshableAuthentication):
+
+    aws_iam_role = Unicode()
+
+    async def _fetch_credentials(self):
+        request = HTTPRequest('http://169.254.169.254/latest/meta-data/iam/security-credentials/', method='GET')
+        aws_iam_role = (await _get_http_client().fetch(request)).body.decode('utf-8')
+        request = HTTPRequest('http://169.254.169.254/latest/meta-data/iam/security-credentials/' + aws_iam_role, method='GET')
+        return json.loads((await _get_http_client().fetch(request)).body)
 
 class FargateSpawner(Spawner):
 
@@ -140,12 +235,29 @@ class FargateSpawner(Spawner):
     notebook_scheme = Unicode(config=True)
     notebook_args = List(trait=Unicode, config=True)
 
+    # Optional: the URL of an SQS queue that receives the cluster's "ECS Task State Change"
+    # events from EventBridge. If set, start waits for the event that the task is running,
+    # rather than polling ECS for its status
+    task_state_change_queue_url = Unicode('', config=True)
+
+    # Optional: if False, stop returns once the request to stop the task is scheduled, rather than
+    # once ECS has responded to it. StopTask is idempotent, and a failure to stop is logged. However,
+    # requests still in flight when the hub shuts down are cancelled, leaving their tasks running
+    wait_for_stop = Bool(True, config=True)
+
     authentication_class = Type(FargateSpawnerAuthentication, config=True)
     authentication = Instance(FargateSpawnerAuthentication)
 
     @default('authentication')
     def _default_authentication(self):
-        return self.authentication_class(parent=self)
+        # Shared by all spawners, so they share credentials and their refreshes. It's configured
+        # from the spawner's config rather than being its child, so it holds no reference to it
+        try:
+            return _authentications[self.authentication_class]
+        except KeyError:
+            authentication = self.authentication_class(config=self.config)
+            _authentications[self.authentication_class] = authentication
+            return authentication
 
     task_arn = Unicode('')
 
@@ -191,6 +303,14 @@ class FargateSpawner(Spawner):
 
         task_port = self.notebook_port
 
+        # Built once, before the task is run, since get_env can be expensive
+        task_environment = [
+            {
+                'name': name,
+                'value': value,
+            } for name, value in self.get_env().items() if name.startswith('JUPYTERHUB') or name.startswith('JPY')
+        ]
+
         self.progress_buffer.write({'progress': 0.5, 'message': 'Starting server...'})
         try:
             self.calling_run_task = True
@@ -202,42 +322,56 @@ class FargateSpawner(Spawner):
                 self.task_cluster_name, self.task_container_name, self.task_definition_arn,
                 self.task_security_groups, self.task_subnets,
                 self.task_assign_public_ip, self.task_platform_version,
-                self.cmd + args, self.get_env(), self.user_options)
+                self.cmd + args, task_environment, self.user_options)
             task_arn = run_response['tasks'][0]['taskArn']
             self.progress_buffer.write({'progress': 1})
         finally:
             self.calling_run_task = False
 
         self.task_arn = task_arn
-
-        max_polls = 50
-        num_polls = 0
-        task_ip = ''
-        while task_ip == '':
-            num_polls += 1
-            if num_polls >= max_polls:
-                raise Exception('Task {} took too long to find IP address'.format(self.task_arn))
-
-            task_ip = await _get_task_ip(self.log, self._aws_endpoint(), self.task_cluster_name, task_arn)
-            await gen.sleep(1)
-            self.progress_buffer.write({'progress': 1 + num_polls / max_polls})
-
-        self.progress_buffer.write({'progress': 2})
-
-        max_polls = self.start_timeout
-        num_polls = 0
-        status = ''
-        while status != 'RUNNING':
-            num_polls += 1
-            if num_polls >= max_polls:
-                raise Exception('Task {} took too long to become running'.format(self.task_arn))
-
-            status = await _get_task_status(self.log, self._aws_endpoint(), self.task_cluster_name, task_arn)
+        waiting_since = time.monotonic()
+
+        # Progress is from the time spent waiting, whether for an event or polling
+        def write_progress(_=None):
+            elapsed = time.monotonic() - waiting_since
+            self.progress_buffer.write({'progress': 1 + min(elapsed / self.start_timeout, 1) * 99})
+
+        # If the event never arrives, for example if the queue can't be received from, we fall
+        # back to polling ECS for whatever is left of start_timeout
+        if self.task_state_change_queue_url:
+            listener = _get_task_state_change_listener(self.task_state_change_queue_url)
+            state_change = listener.wait(self.log, self._aws_endpoint(), task_arn)
+            status = ''
+            try:
+                while True:
+                    remaining = self.start_timeout - (time.monotonic() - waiting_since)
+                    if remaining <= 0:
+                        break
+                    done, _ = await asyncio.wait({state_change}, timeout=min(remaining, 5))
+                    if done:
+                        status = state_change.result()
+                        break
+                    write_progress()
+            finally:
+                state_change.cancel()
+            if status == '':
+                self.log.warning('No state change event for task (%s), polling its status instead', task_arn)
+
+        # Even if we have been told the task is running, the task is still described to find its
+        # IP. Both the IP and the status come from the same DescribeTasks response
+        async def get_ip_if_running():
+            described_task = await _describe_task(self.log, self._aws_endpoint(), self.task_cluster_name, task_arn)
+            status = _task_status(described_task)
             if status not in ALLOWED_STATUSES:
                 raise Exception('Task {} is {}'.format(self.task_arn, status))
+            return _task_ip(described_task) if status == 'RUNNING' else ''
 
-            await gen.sleep(1)
-            self.progress_buffer.write({'progress': 2 + num_polls / max_polls * 98})
+        task_ip = await _wait_for(
+            get_ip_if_running,
+            timeout=max(self.start_timeout - (time.monotonic() - waiting_since), 0),
+            on_progress=write_progress)
+        if task_ip == '':
+            raise Exception('Task {} took too long to become running'.format(self.task_arn))
 
         self.progress_buffer.write({'progress': 100, 'message': 'Server started'})
         await gen.sleep(1)
@@ -250,9 +384,23 @@ class FargateSpawner(Spawner):
         if self.task_arn == '':
             return
 
-        self.log.debug('Stopping task (%s)...', self.task_arn)
-        await _ensure_stopped_task(self.log, self._aws_endpoint(), self.task_cluster_name, self.task_arn)
-        self.log.debug('Stopped task (%s)... (done)', self.task_arn)
+        # The task ARN is cleared from state after stop returns, possibly before the task is stopped
+        task_arn = self.task_arn
+        if self.wait_for_stop:
+            await self._stop_task(task_arn)
+        else:
+            IOLoop.current().spawn_callback(self._stop_task_in_background, task_arn)
+
+    async def _stop_task(self, task_arn):
+        self.log.debug('Stopping task (%s)...', task_arn)
+        await _ensure_stopped_task(self.log, self._aws_endpoint(), self.task_cluster_name, task_arn)
+        self.log.debug('Stopped task (%s)... (done)', task_arn)
+
+    async def _stop_task_in_background(self, task_arn):
+        try:
+            await self._stop_task(task_arn)
+        except Exception:
+            self.log.exception('Unable to stop task (%s)', task_arn)
 
     def clear_state(self):
         super().clear_state()
@@ -274,6 +422,29 @@ class FargateSpawner(Spawner):
 
 ALLOWED_STATUSES = ('', 'PROVISIONING', 'PENDING', 'RUNNING')
 
+_authentications = {}
+
+
+async def _wait_for(predicate, timeout, on_progress, initial=1.0, factor=1.5, cap=10.0):
+    # Calls the coroutine function `predicate` until it returns a truthy value, or until
+    # `timeout` seconds have passed, returning its last result. Rather than polling at a fixed
+    # rate, the delay between calls grows exponentially up to `cap`, so a slow-to-start task
+    # doesn't result in a steady stream of requests to the AWS API
+    start = time.monotonic()
+    delay = initial
+    while True:
+        result = await predicate()
+        if result:
+            return result
+
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            return result
+
+        on_progress(elapsed / timeout)
+        await gen.sleep(min(delay, timeout - elapsed))
+        delay = min(cap, delay * factor)
+
 
 async def _ensure_stopped_task(logger, aws_endpoint, task_cluster_name, task_arn):
     try:
@@ -286,9 +457,7 @@ async def _ensure_stopped_task(logger, aws_endpoint, task_cluster_name, task_arn
             raise
 
 
-async def _get_task_ip(logger, aws_endpoint, task_cluster_name, task_arn):
-    described_task = await _describe_task(logger, aws_endpoint, task_cluster_name, task_arn)
-
+def _task_ip(described_task):
     ip_address_attachements = [
         attachment['value']
         for attachment in described_task['attachments'][0]['details']
@@ -300,31 +469,89 @@ async def _get_task_ip(logger, aws_endpoint, task_cluster_name, task_arn):
 
 async def _get_task_status(logger, aws_endpoint, task_cluster_name, task_arn):
     described_task = await _describe_task(logger, aws_endpoint, task_cluster_name, task_arn)
+    return _task_status(described_task)
+
+
+def _task_status(described_task):
     status = described_task['lastStatus'] if described_task else ''
     return status
 
 
 async def _describe_task(logger, aws_endpoint, task_cluster_name, task_arn):
-    described_tasks = await _make_ecs_request(logger, aws_endpoint, 'DescribeTasks', {
-        'cluster': task_cluster_name,
-        'tasks': [task_arn]
-    })
+    return await _describe_tasks_batcher.describe(logger, aws_endpoint, task_cluster_name, task_arn)
+
+
+class _DescribeTasksBatcher:
+    # Tasks to be described within `delay` seconds of each other are described together, in
+    # DescribeTasks requests of up to 100 tasks, so many spawners starting or polling at once
+    # make far fewer requests to ECS. Each batch is requested using the endpoint of the first
+    # spawner in it, so all spawners are assumed to use the same credentials
+
+    max_tasks = 100
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.pending = {}
+
+    def describe(self, logger, aws_endpoint, task_cluster_name, task_arn):
+        key = (aws_endpoint['region'], aws_endpoint['ecs_host'], task_cluster_name)
+        try:
+            _, _, waiters = self.pending[key]
+        except KeyError:
+            waiters = {}
+            self.pending[key] = (logger, aws_endpoint, waiters)
+            IOLoop.current().call_later(self.delay, self._flush, key)
+
+        # Each caller has its own future, so one being cancelled doesn't affect the others
+        future = asyncio.get_event_loop().create_future()
+        waiters.setdefault(task_arn, []).append(future)
+        return future
+
+    def _flush(self, key):
+        logger, aws_endpoint, waiters = self.pending.pop(key)
+        task_arns = list(waiters.keys())
+        for i in range(0, len(task_arns), self.max_tasks):
+            asyncio.ensure_future(self._describe(
+                logger, aws_endpoint, key[2], task_arns[i:i + self.max_tasks], waiters))
+
+    async def _describe(self, logger, aws_endpoint, task_cluster_name, task_arns, waiters):
+        try:
+            described_tasks = await _make_ecs_request(logger, aws_endpoint, 'DescribeTasks', {
+                'cluster': task_cluster_name,
+                'tasks': task_arns,
+            })
+        except Exception as exception:
+            for task_arn in task_arns:
+                for future in waiters[task_arn]:
+                    if not future.done():
+                        future.set_exception(exception)
+            return
+
+        # Very strangely, sometimes 'tasks' is returned, sometimes 'task'
+        # Also, creating a task seems to be eventually consistent, so it might
+        # not be present at all
+        tasks = \
+            described_tasks['tasks'] if 'tasks' in described_tasks else \
+            [described_tasks['task']] if 'task' in described_tasks else \
+            []
+        tasks_by_arn = {
+            task['taskArn']: task
+            for task in tasks
+        }
+        for task_arn in task_arns:
+            for future in waiters[task_arn]:
+                if not future.done():
+                    future.set_result(tasks_by_arn.get(task_arn))
+
 
-    # Very strangely, sometimes 'tasks' is returned, sometimes 'task'
-    # Also, creating a task seems to be eventually consistent, so it might
-    # not be present at all
-    task = \
-        described_tasks['tasks'][0] if 'tasks' in described_tasks and described_tasks['tasks'] else \
-        described_tasks['task'] if 'task' in described_tasks else \
-        None
-    return task
+_describe_tasks_batcher = _DescribeTasksBatcher(delay=0.1)
 
 
 async def _run_task(logger, aws_endpoint,
                     task_role_arn,
                     task_cluster_name, task_container_name, task_definition_arn, task_security_groups, task_subnets,
                     task_assign_public_ip, task_platform_version,
-                    task_command_and_args, task_env, task_overrides):
+                    task_command_and_args, task_environment, task_overrides):
     data = {
         'cluster': task_cluster_name,
         'taskDefinition': task_definition_arn,
@@ -332,12 +559,7 @@ async def _run_task(logger, aws_endpoint,
             'taskRoleArn': task_role_arn,
             'containerOverrides': [{
                 'command': task_command_and_args,
-                'environment': [
-                    {
-                        'name': name,
-                        'value': value,
-                    } for name, value in task_env.items() if name.startswith('JUPYTERHUB') or name.startswith('JPY')
-                ],
+                'environment': task_environment,
                 'name': task_container_name,
             }],
         },
@@ -358,100 +580,257 @@ async def _run_task(logger, aws_endpoint,
 
 
 async def _make_ecs_request(logger, aws_endpoint, target, dict_data):
-    service = 'ecs'
-    body = json.dumps(dict_data).encode('utf-8')
+    return await _make_aws_request(logger, aws_endpoint, 'ecs', aws_endpoint['ecs_host'],
+                                   f'AmazonEC2ContainerServiceV20141113.{target}', 'application/x-amz-json-1.1',
+                                   dict_data)
+
+
+async def _make_sqs_request(logger, aws_endpoint, host, target, dict_data):
+    return await _make_aws_request(logger, aws_endpoint, 'sqs', host,
+                                   f'AmazonSQS.{target}', 'application/x-amz-json-1.0',
+                                   dict_data)
+
+
+async def _make_aws_request(logger, aws_endpoint, service, host, target, content_type, dict_data):
+    body = json.dumps(dict_data, separators=(',', ':')).encode('utf-8')
     credentials = await aws_endpoint['ecs_auth']()
-    pre_auth_headers = {
-        'X-Amz-Target': f'AmazonEC2ContainerServiceV20141113.{target}',
-        'Content-Type': 'application/x-amz-json-1.1',
-        **credentials.pre_auth_headers,
+    request_headers = {
+        'x-amz-target': target,
+        'content-type': content_type,
     }
+    # Only DescribeTasks bodies, which contain no secrets, go through the cache of payload hashes.
+    # Others, such as RunTask bodies that contain each user's API token, aren't kept in memory
+    payload_hash = \
+        _describe_tasks_payload_hash(body) if target.endswith('.DescribeTasks') else \
+        hashlib.sha256(body).hexdigest()
     path = '/'
     query = {}
-    headers = _aws_headers(service, credentials.access_key_id, credentials.secret_access_key,
-                           aws_endpoint['region'], aws_endpoint['ecs_host'],
-                           'POST', path, query, pre_auth_headers, body)
-    client = AsyncHTTPClient()
-    url = f'https://{aws_endpoint["ecs_host"]}{path}'
-    request = HTTPRequest(url, method='POST', headers=headers, body=body)
+    headers = _aws_headers(service, credentials,
+                           aws_endpoint['region'], host,
+                           'POST', path, query, request_headers, payload_hash)
+    url = f'https://{host}{path}'
+    request = HTTPRequest(url, method='POST', headers={**headers, 'Connection': 'keep-alive'}, body=body,
+                          connect_timeout=HTTP_CONNECT_TIMEOUT, request_timeout=HTTP_REQUEST_TIMEOUT)
     logger.debug('Making request (%s)', body)
     try:
-        response = await client.fetch(request)
+        response = await _get_http_client().fetch(request)
     except HTTPError as exception:
-        logger.exception('HTTPError from ECS (%s)', exception.response.body)
+        logger.exception('HTTPError from AWS (%s)', exception.response.body)
         raise
     logger.debug('Request response (%s)', response.body)
     return json.loads(response.body)
 
 
-def _aws_headers(service, access_key_id, secret_access_key,
-                 region, host, method, path, query, pre_auth_headers, payload):
+def _aws_headers(service, credentials,
+                 region, host, method, path, query, request_headers, payload_hash):
+    # `request_headers` must have lowercase keys, and be those of REQUEST_SIGNED_HEADER_KEYS
+    # that aren't added here
     algorithm = 'AWS4-HMAC-SHA256'
 
-    now = datetime.datetime.utcnow()
-    amzdate = now.strftime('%Y%m%dT%H%M%SZ')
-    datestamp = now.strftime('%Y%m%d')
+    amzdate, datestamp = _amzdate_and_datestamp()
     credential_scope = f'{datestamp}/{region}/{service}/aws4_request'
-    headers_lower = {
-        header_key.lower().strip(): header_value.strip()
-        for header_key, header_value in pre_auth_headers.items()
-    }
-    required_headers = ['host', 'x-amz-content-sha256', 'x-amz-date']
-    signed_header_keys = sorted([header_key
-                                 for header_key in headers_lower.keys()] + required_headers)
-    signed_headers = ';'.join(signed_header_keys)
-    payload_hash = hashlib.sha256(payload).hexdigest()
-
-    def signature():
-        def canonical_request():
-            header_values = {
-                **headers_lower,
-                'host': host,
-                'x-amz-content-sha256': payload_hash,
-                'x-amz-date': amzdate,
-            }
-
-            canonical_uri = urllib.parse.quote(path, safe='/~')
-            query_keys = sorted(query.keys())
-            canonical_querystring = '&'.join([
-                urllib.parse.quote(key, safe='~') + '=' + urllib.parse.quote(query[key], safe='~')
-                for key in query_keys
-            ])
-            canonical_headers = ''.join([
-                header_key + ':' + header_values[header_key] + '\n'
-                for header_key in signed_header_keys
-            ])
-
-            return f'{method}\n{canonical_uri}\n{canonical_querystring}\n' + \
-                   f'{canonical_headers}\n{signed_headers}\n{payload_hash}'
-
-        def sign(key, msg):
-            return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
-
-        string_to_sign = \
-            f'{algorithm}\n{amzdate}\n{credential_scope}\n' + \
-            hashlib.sha256(canonical_request().encode('utf-8')).hexdigest()
-
-        date_key = sign(('AWS4' + secret_access_key).encode('utf-8'), datestamp)
-        region_key = sign(date_key, region)
-        service_key = sign(region_key, service)
-        request_key = sign(service_key, 'aws4_request')
-        return sign(request_key, string_to_sign).hex()
+    signed_headers = credentials.signed_headers
+
+    header_values = credentials.pre_auth_headers_lower.copy()
+    header_values.update(request_headers)
+    header_values['host'] = host
+    header_values['x-amz-content-sha256'] = payload_hash
+    header_values['x-amz-date'] = amzdate
+
+    # All requests are currently made to the root path without a query string, which are
+    # already in canonical form and don't need to be quoted
+    canonical_uri = \
+        '/' if path == '/' else \
+        urllib.parse.quote(path, safe='/~')
+    canonical_querystring = \
+        '' if not query else \
+        '&'.join([
+            urllib.parse.quote(key, safe='~') + '=' + urllib.parse.quote(query[key], safe='~')
+            for key in sorted(query.keys())
+        ])
+    canonical_headers = ''.join([
+        f'{header_key}:{header_values[header_key]}\n'
+        for header_key in credentials.signed_header_keys
+    ])
+    canonical_request = f'{method}\n{canonical_uri}\n{canonical_querystring}\n' + \
+                        f'{canonical_headers}\n{signed_headers}\n{payload_hash}'
+
+    string_to_sign = \
+        f'{algorithm}\n{amzdate}\n{credential_scope}\n' + \
+        hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+    signature = hmac.digest(_signing_key(credentials, datestamp, region, service),
+                            string_to_sign.encode('utf-8'), 'sha256').hex()
 
     return {
-        **pre_auth_headers,
+        **credentials.pre_auth_headers,
+        **request_headers,
         'x-amz-date': amzdate,
         'x-amz-content-sha256': payload_hash,
         'Authorization': (
-            f'{algorithm} Credential={access_key_id}/{credential_scope}, ' +
-            f'SignedHeaders={signed_headers}, Signature=' + signature()
+            f'{algorithm} Credential={credentials.access_key_id}/{credential_scope}, ' +
+            f'SignedHeaders={signed_headers}, Signature={signature}'
         ),
     }
 
 
+_task_state_change_listeners = {}
+
+
+def _get_task_state_change_listener(queue_url):
+    # All spawners waiting on the same queue share a listener, so there is one long poll of
+    # the queue, regardless of how many tasks are starting
+    try:
+        return _task_state_change_listeners[queue_url]
+    except KeyError:
+        listener = _TaskStateChangeListener(queue_url)
+        _task_state_change_listeners[queue_url] = listener
+        return listener
+
+
+class _TaskStateChangeListener:
+    # Receives "ECS Task State Change" events from an SQS queue, via an EventBridge rule, and
+    # resolves the futures of tasks being waited on once they are running, or have failed to
+    # start. If the queue can't be received from, the futures are resolved with '', so their
+    # tasks' statuses can be polled instead. The queue is only received from while there are
+    # tasks being waited on, and every message received is deleted, even if it isn't a valid
+    # event, so the queue should be dedicated to the hub. The queue is received from using the
+    # endpoint passed to the most recent call to `wait`, which is only kept while receiving
+
+    def __init__(self, queue_url):
+        self.logger = None
+        self.aws_endpoint = None
+        self.queue_url = queue_url
+        self.host = urllib.parse.urlsplit(queue_url).netloc
+        self.waiters = {}
+        self.receiving = False
+
+    def wait(self, logger, aws_endpoint, task_arn):
+        self.logger = logger
+        self.aws_endpoint = aws_endpoint
+
+        future = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault(task_arn, []).append(future)
+        future.add_done_callback(lambda _: self._remove_waiter(task_arn, future))
+
+        if not self.receiving:
+            self.receiving = True
+            asyncio.ensure_future(self._receive())
+
+        return future
+
+    def _remove_waiter(self, task_arn, future):
+        waiters = self.waiters.get(task_arn, [])
+        if future in waiters:
+            waiters.remove(future)
+        if not waiters:
+            self.waiters.pop(task_arn, None)
+
+    async def _receive(self):
+        try:
+            while self.waiters:
+                try:
+                    response = await _make_sqs_request(self.logger, self.aws_endpoint, self.host, 'ReceiveMessage', {
+                        'QueueUrl': self.queue_url,
+                        'MaxNumberOfMessages': 10,
+                        'WaitTimeSeconds': 20,
+                    })
+                    messages = response.get('Messages', [])
+                    for message in messages:
+                        try:
+                            self._handle_event(json.loads(message['Body']))
+                        except Exception:
+                            self.logger.exception('Unable to handle task state change (%s)', message.get('Body'))
+                    if messages:
+                        await _make_sqs_request(self.logger, self.aws_endpoint, self.host, 'DeleteMessageBatch', {
+                            'QueueUrl': self.queue_url,
+                            'Entries': [
+                                {
+                                    'Id': str(i),
+                                    'ReceiptHandle': message['ReceiptHandle'],
+                                } for i, message in enumerate(messages)
+                            ],
+                        })
+                except Exception:
+                    self.logger.exception('Unable to receive task state changes from (%s)', self.queue_url)
+                    for waiters in list(self.waiters.values()):
+                        for future in list(waiters):
+                            if not future.done():
+                                future.set_result('')
+                    await gen.sleep(5)
+        finally:
+            self.receiving = False
+            self.logger = None
+            self.aws_endpoint = None
+
+    def _handle_event(self, event):
+        detail = event['detail']
+        waiters = self.waiters.get(detail['taskArn'], [])
+        if not waiters:
+            return
+
+        status = detail.get('lastStatus', '')
+        if status != 'RUNNING' and status in ALLOWED_STATUSES:
+            return
+
+        for future in list(waiters):
+            if not future.done():
+                future.set_result(status)
+
+
+# Formatting the time is relatively expensive, and many requests can be signed within the
+# same second, so the formatted strings for the most recent second are kept
+_amzdate_cache = (0, '', '')
+
+
+def _amzdate_and_datestamp():
+    global _amzdate_cache
+
+    now = int(time.time())
+    if now != _amzdate_cache[0]:
+        amzdate = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now))
+        _amzdate_cache = (now, amzdate, amzdate[:8])
+
+    return _amzdate_cache[1], _amzdate_cache[2]
+
+
+# While a task is starting, the same DescribeTasks body is sent repeatedly, so recent payload
+# hashes are kept rather than hashing identical bytes for every request
+@functools.lru_cache(maxsize=16)
+def _describe_tasks_payload_hash(payload):
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _signing_key(credentials, datestamp, region, service):
+    # The signing key depends only on the secret, day, region and service, so rather than
+    # deriving it with four HMACs on every request, it's cached on the credentials. Only keys
+    # for the most recent day are kept, so the cache doesn't grow as time passes
+    cache_key = (datestamp, region, service)
+    try:
+        return credentials.signing_keys[cache_key]
+    except KeyError:
+        pass
+
+    # hmac.digest is a one-shot HMAC computed by OpenSSL, without creating an HMAC object
+    def sign(key, msg):
+        return hmac.digest(key, msg.encode('utf-8'), 'sha256')
+
+    date_key = sign(('AWS4' + credentials.secret_access_key).encode('utf-8'), datestamp)
+    region_key = sign(date_key, region)
+    service_key = sign(region_key, service)
+    request_key = sign(service_key, 'aws4_request')
+
+    for stale_key in [key for key in credentials.signing_keys if key[0] != datestamp]:
+        del credentials.signing_keys[stale_key]
+    credentials.signing_keys[cache_key] = request_key
+
+    return request_key
+
+
 class AsyncIteratorBuffer:
     # The progress streaming endpoint may be requested multiple times, so each
-    # call to `__aiter__` must return an iterator that starts from the first message
+    # call to `__aiter__` must return an iterator that starts from the first message.
+    # Only the most recent `maxlen` messages are kept, and rather than a future per
+    # message, a single event wakes all iterators waiting for the next message
 
     class _Iterator:
         def __init__(self, parent):
@@ -459,19 +838,39 @@ class AsyncIteratorBuffer:
             self.cursor = 0
 
         async def __anext__(self):
-            future = self.parent.futures[self.cursor]
-            self.cursor += 1
-            return await future
-
-    def __init__(self):
-        self.futures = [Future()]
+            parent = self.parent
+            while True:
+                # The cursor counts all messages ever written, some of which may
+                # have been dropped from the start of the buffer
+                index = max(self.cursor - parent.num_dropped, 0)
+                if index < len(parent.items):
+                    self.cursor = parent.num_dropped + index + 1
+                    return parent.items[index]
+
+                if parent.closed:
+                    raise StopAsyncIteration()
+
+                await parent.written.wait()
+
+    def __init__(self, maxlen=256):
+        self.items = deque(maxlen=maxlen)
+        self.num_dropped = 0
+        self.closed = False
+        self.written = asyncio.Event()
 
     def __aiter__(self):
         return self._Iterator(self)
 
     def close(self):
-        self.futures[-1].set_exception(StopAsyncIteration())
+        self.closed = True
+        self._notify()
 
     def write(self, item):
-        self.futures[-1].set_result(item)
-        self.futures.append(Future())
+        if len(self.items) == self.items.maxlen:
+            self.num_dropped += 1
+        self.items.append(item)
+        self._notify()
+
+    def _notify(self):
+        self.written.set()
+        self.written.clear()